@@ -11,7 +11,7 @@ import csv
 from datetime import datetime, timezone, timedelta
 from flask import Flask, jsonify, request
 from flask_cors import CORS
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, insert, text
 from sqlalchemy.orm import sessionmaker
 import importlib.util
 
@@ -26,8 +26,11 @@ Session = sessionmaker(bind=engine)
 # Import SensorReading for saving relay states
 import sys
 sys.path.insert(0, os.path.dirname(__file__))
-from db import SensorReading
+from db import SensorReading, enable_sqlite_pragmas
+if DB_URL.startswith("sqlite"):
+    enable_sqlite_pragmas(engine)
 from automation import AutomationController
+from calibration import calibrate_ph, calibrate_do, calibrate_tds
 
 # In-memory relay states (persisted in DB for reliability)
 RELAY_STATES = {i: False for i in range(1, 10)}  # 9 relays
@@ -98,19 +101,27 @@ print("[API] Automation started (misting: 10s ON / 3m OFF, lights: 6am-6pm)")
 import threading
 import time
 
+# (sensor name in DB, key expected by AutomationController)
+_FEEDER_SENSORS = [("temperature_c", "temperature_c"), ("humidity", "humidity"),
+                   ("ph", "ph"), ("do_mg_per_l", "do_mg_l"), ("tds_ppm", "tds_ppm")]
+# Latest value of every fed sensor in one statement (one scalar subquery each)
+_FEEDER_LATEST_SQL = text("SELECT " + ", ".join(
+    f"(SELECT value FROM sensor_readings WHERE sensor = :s{i} ORDER BY timestamp DESC LIMIT 1)"
+    for i in range(len(_FEEDER_SENSORS))
+))
+_FEEDER_PARAMS = {f"s{i}": sensor for i, (sensor, _) in enumerate(_FEEDER_SENSORS)}
+
 def _automation_sensor_feeder():
     """Feed latest sensor readings to automation controller every second"""
     while True:
         try:
             with Session() as session:
-                sensors = {}
-                for sensor, key in [("temperature_c", "temperature_c"), ("humidity", "humidity"), 
-                                   ("ph", "ph"), ("do_mg_per_l", "do_mg_l"), ("tds_ppm", "tds_ppm")]:
-                    result = session.execute(text(
-                        "SELECT value FROM sensor_readings WHERE sensor = :s ORDER BY timestamp DESC LIMIT 1"
-                    ), {"s": sensor}).fetchone()
-                    if result:
-                        sensors[key] = result[0]
+                row = session.execute(_FEEDER_LATEST_SQL, _FEEDER_PARAMS).fetchone()
+                sensors = {
+                    key: value
+                    for (_, key), value in zip(_FEEDER_SENSORS, row)
+                    if value is not None
+                }
                 
                 if sensors:
                     automation_controller.update_sensors(sensors)
@@ -144,6 +155,28 @@ def get_predictor():
         return None
 
 
+# ML-MARCH24-FINAL model set used by /api/predict; joblib-loading every model
+# and scaler is far slower than a prediction, so it is loaded once per process
+_growth_predictor = None
+_growth_predictor_lock = threading.Lock()
+
+def get_growth_predictor():
+    """Lazy load the ML-MARCH24-FINAL predictor.
+
+    Only cached once every system's model set is complete; until then each
+    call reloads, so model files deployed later are picked up.
+    """
+    global _growth_predictor
+    with _growth_predictor_lock:
+        if _growth_predictor is None:
+            from ml_predictor import PlantGrowthPredictor
+            loaded = PlantGrowthPredictor()
+            if not all(loaded.system_ready.values()):
+                return loaded
+            _growth_predictor = loaded
+        return _growth_predictor
+
+
 @app.route("/")
 def home():
     return """
@@ -210,6 +243,56 @@ def db_status():
         return {"db_connected": False, "error": str(e)}
 
 
+# /api/ingest invariants (hoisted out of the per-request path)
+_INGEST_ALLOWED = frozenset({
+    "temperature_c", "humidity", "tds_ppm",
+    "ph", "do_mg_per_l", "do_mg_l",
+    "ph_voltage_v", "do_voltage_v", "tds_voltage_v",
+})
+_INGEST_UNITS = {
+    "temperature_c": "C",
+    "humidity": "%",
+    "tds_ppm": "ppm",
+    "ph": "pH",
+    "do_mg_per_l": "mg/L",
+    "do_mg_l": "mg/L",
+    "ph_voltage_v": "V",
+    "do_voltage_v": "V",
+    "tds_voltage_v": "V",
+}
+# (voltage key, calibrated output keys, calibrate fn, recompute even if device sent a value)
+# TDS is always recomputed so live values stay aligned with calibration.json even
+# when the device sends raw/uncalibrated tds_ppm.
+_INGEST_CALIBRATIONS = (
+    ("ph_voltage_v", ("ph",), calibrate_ph, False),
+    ("do_voltage_v", ("do_mg_per_l", "do_mg_l"), calibrate_do, False),  # do_mg_l: compatibility alias
+    ("tds_voltage_v", ("tds_ppm",), calibrate_tds, True),
+)
+
+
+def _parse_ts(raw_ts) -> datetime:
+    """Parse an ingest payload timestamp (ISO 8601, 'Z' allowed) as aware UTC.
+    Falls back to now when missing or unparseable."""
+    if raw_ts:
+        s = str(raw_ts)
+        # Fast path for the ESP32's fixed "YYYY-MM-DDTHH:MM:SSZ" shape
+        if len(s) == 20 and s[-1] == "Z" and s[4] == "-" and s[10] == "T":
+            try:
+                return datetime(int(s[0:4]), int(s[5:7]), int(s[8:10]),
+                                int(s[11:13]), int(s[14:16]), int(s[17:19]),
+                                tzinfo=timezone.utc)
+            except ValueError:
+                pass
+        try:
+            ts = datetime.fromisoformat(s.replace("Z", "+00:00"))
+            if ts.tzinfo is None:
+                ts = ts.replace(tzinfo=timezone.utc)
+            return ts
+        except Exception:
+            pass
+    return datetime.now(timezone.utc)
+
+
 @app.route("/api/ingest", methods=["POST"])
 def ingest():
     """Ingest readings into local DB (used by firebase_sync serial thread and ESP32 HTTP uploads)."""
@@ -218,81 +301,41 @@ def ingest():
     if not isinstance(readings, dict):
         return jsonify({"success": False, "error": "invalid readings"}), 400
 
-    # Parse timestamp if provided, else use now
-    ts = datetime.now(timezone.utc)
-    raw_ts = payload.get("ts") or payload.get("timestamp")
-    if raw_ts:
-        try:
-            ts = datetime.fromisoformat(str(raw_ts).replace("Z", "+00:00"))
-            if ts.tzinfo is None:
-                ts = ts.replace(tzinfo=timezone.utc)
-        except Exception:
-            pass
+    # Parse timestamp once per message; every row below shares this datetime
+    ts = _parse_ts(payload.get("ts") or payload.get("timestamp"))
 
     # Compute calibrated values if only voltages are provided
     computed = dict(readings)
-    try:
-        if "ph" not in computed and "ph_voltage_v" in computed:
-            from calibration import calibrate_ph
-            computed["ph"] = float(calibrate_ph(float(computed["ph_voltage_v"])))
-    except Exception:
-        pass
-    try:
-        if "do_mg_per_l" not in computed and "do_voltage_v" in computed:
-            from calibration import calibrate_do
-            do_val = float(calibrate_do(float(computed["do_voltage_v"])))
-            computed["do_mg_per_l"] = do_val
-            computed["do_mg_l"] = do_val  # compatibility alias
-    except Exception:
-        pass
-    try:
-        # If TDS voltage is present, prefer calibrated TDS from local calibration.
-        # This keeps live values aligned with calibration.json even when device sends raw/uncalibrated tds_ppm.
-        if "tds_voltage_v" in computed:
-            from calibration import calibrate_tds
-            computed["tds_ppm"] = float(calibrate_tds(float(computed["tds_voltage_v"])))
-    except Exception:
-        pass
-
-    allowed = {
-        "temperature_c", "humidity", "tds_ppm",
-        "ph", "do_mg_per_l", "do_mg_l",
-        "ph_voltage_v", "do_voltage_v", "tds_voltage_v"
-    }
-    units = {
-        "temperature_c": "C",
-        "humidity": "%",
-        "tds_ppm": "ppm",
-        "ph": "pH",
-        "do_mg_per_l": "mg/L",
-        "do_mg_l": "mg/L",
-        "ph_voltage_v": "V",
-        "do_voltage_v": "V",
-        "tds_voltage_v": "V",
-    }
+    for voltage_key, out_keys, calibrate, always in _INGEST_CALIBRATIONS:
+        if voltage_key not in computed or (not always and out_keys[0] in computed):
+            continue
+        try:
+            cal_val = float(calibrate(float(computed[voltage_key])))
+        except Exception:
+            continue
+        for key in out_keys:
+            computed[key] = cal_val
 
+    # One meta dict per message, shared by every row (rows never mutate it)
+    meta = {"source": "http_ingest", "device": payload.get("device", "unknown")}
     to_insert = []
-    for sensor_name, value in computed.items():
-        if sensor_name not in allowed:
-            continue
+    for sensor_name in _INGEST_ALLOWED.intersection(computed):
         try:
-            v = float(value)
+            v = float(computed[sensor_name])
         except Exception:
             continue
-        to_insert.append(
-            SensorReading(
-                timestamp=ts,
-                sensor=str(sensor_name),
-                value=v,
-                unit=units.get(sensor_name),
-                meta={"source": "http_ingest", "device": payload.get("device", "unknown")},
-            )
-        )
+        to_insert.append({
+            "timestamp": ts,
+            "sensor": sensor_name,
+            "value": v,
+            "unit": _INGEST_UNITS.get(sensor_name),
+            "meta": meta,
+        })
 
-    with Session() as session:
-        if to_insert:
-            session.add_all(to_insert)
-            session.commit()
+    # Plain dict rows + one executemany: no ORM objects / identity-map bookkeeping
+    if to_insert:
+        with engine.begin() as conn:
+            conn.execute(insert(SensorReading), to_insert)
 
     return jsonify({"success": True, "inserted": len(to_insert)})
 
@@ -897,32 +940,23 @@ def export_ml_training():
             cutoff = datetime.now(timezone.utc) - timedelta(days=365)
     
     with Session() as session:
-        # 15-minute averaged sensor readings
+        # 15-minute averaged sensor readings, pivoted in SQL: one row per
+        # bucket with a conditional AVG column per sensor
         sensor_rows = session.execute(text("""
             SELECT
                 strftime('%Y-%m-%d %H:', timestamp) ||
                     SUBSTR('0' || CAST((CAST(strftime('%M', timestamp) AS INTEGER) / 15) * 15 AS TEXT), -2, 2) AS time_bucket,
-                sensor,
-                ROUND(AVG(value), 4) AS avg_value
+                ROUND(AVG(CASE WHEN sensor = 'ph' THEN value END), 4) AS ph,
+                -- DO sensor: use do_mg_l for old data (before Mar 21) and do_mg_per_l for new data
+                ROUND(AVG(CASE WHEN sensor IN ('do_mg_l', 'do_mg_per_l') THEN value END), 4) AS do_mg_per_l,
+                ROUND(AVG(CASE WHEN sensor = 'tds_ppm' THEN value END), 4) AS tds_ppm,
+                ROUND(AVG(CASE WHEN sensor = 'temperature_c' THEN value END), 4) AS temperature_c,
+                ROUND(AVG(CASE WHEN sensor = 'humidity' THEN value END), 4) AS humidity
             FROM sensor_readings
-            WHERE sensor IN ('ph','tds_ppm','temperature_c','humidity')
-            AND timestamp >= :cutoff
-            GROUP BY time_bucket, sensor
-            
-            UNION ALL
-            
-            -- DO sensor: use do_mg_l for old data (before Mar 21) and do_mg_per_l for new data
-            SELECT
-                strftime('%Y-%m-%d %H:', timestamp) ||
-                    SUBSTR('0' || CAST((CAST(strftime('%M', timestamp) AS INTEGER) / 15) * 15 AS TEXT), -2, 2) AS time_bucket,
-                'do_mg_per_l' as sensor,
-                ROUND(AVG(value), 4) AS avg_value
-            FROM sensor_readings
-            WHERE (sensor = 'do_mg_l' OR sensor = 'do_mg_per_l')
+            WHERE sensor IN ('ph','do_mg_l','do_mg_per_l','tds_ppm','temperature_c','humidity')
             AND timestamp >= :cutoff
             GROUP BY time_bucket
-            
-            ORDER BY time_bucket, sensor
+            ORDER BY time_bucket
         """), {"cutoff": cutoff}).fetchall()
         
         # All plant readings
@@ -937,15 +971,15 @@ def export_ml_training():
         except:
             plant_rows = []
     
-    # Build sensor lookup
+    # Build sensor lookup (rows are already one per bucket; NULL averages are
+    # dropped so missing sensors still export as '-')
+    sensor_cols = ('ph', 'do_mg_per_l', 'tds_ppm', 'temperature_c', 'humidity')
     sensor_lookup = {}
     all_buckets = []
     for row in sensor_rows:
         bucket = row[0]
-        if bucket not in sensor_lookup:
-            sensor_lookup[bucket] = {}
-            all_buckets.append(bucket)
-        sensor_lookup[bucket][row[1]] = row[2]
+        all_buckets.append(bucket)
+        sensor_lookup[bucket] = {k: v for k, v in zip(sensor_cols, row[1:]) if v is not None}
     
     # Build plant lookup
     plant_lookup = {}
@@ -968,15 +1002,22 @@ def export_ml_training():
             "Height": row[7] if row[7] is not None else "-",
         }
     
-    # Calculate day numbers
-    first_day = all_buckets[0][:10] if all_buckets else ""
+    # Calculate day numbers (first day parsed once; ~96 buckets share each date)
+    try:
+        first_ordinal = datetime.strptime(all_buckets[0][:10], "%Y-%m-%d").toordinal()
+    except Exception:
+        first_ordinal = None
+    day_nums = {}
     def day_num(bucket):
-        try:
-            d1 = datetime.strptime(first_day, "%Y-%m-%d")
-            d2 = datetime.strptime(bucket[:10], "%Y-%m-%d")
-            return (d2 - d1).days + 1
-        except Exception:
-            return 0
+        date_str = bucket[:10]
+        n = day_nums.get(date_str)
+        if n is None:
+            try:
+                n = datetime.strptime(date_str, "%Y-%m-%d").toordinal() - first_ordinal + 1
+            except Exception:
+                n = 0
+            day_nums[date_str] = n
+        return n
     
     farming_systems = ['aeroponics', 'dwc']
     headers = ['timestamp', 'day', 'farming_system',
@@ -1171,8 +1212,6 @@ def predict_plant_growth():
         }
     }
     """
-    from ml_predictor import PlantGrowthPredictor
-    
     try:
         data = request.get_json()
         date_str = data.get('date')
@@ -1210,37 +1249,24 @@ def predict_plant_growth():
             except Exception:
                 return jsonify({"success": False, "error": "Invalid manual sensor_data payload"}), 400
         else:
-            sensor_map = {
-                'ave_ph': ['ph'],
-                'ave_do': ['do_mg_per_l', 'do_mg_l'],
-                'ave_tds': ['tds_ppm'],
-                'ave_temp': ['temperature_c'],
-                'ave_humidity': ['humidity']
-            }
-
+            # One pass over the day's rows; each feature is a conditional AVG
+            # (DO supports both historical sensor names)
             with Session() as session:
-                for key, sensor_names in sensor_map.items():
-                    if key == 'ave_do':
-                        # Support both historical naming conventions for DO sensor
-                        result = session.execute(text("""
-                            SELECT AVG(value)
-                            FROM sensor_readings
-                            WHERE date(timestamp) = :date_only
-                              AND sensor IN ('do_mg_per_l', 'do_mg_l')
-                        """), {"date_only": date_only}).fetchone()
-                    else:
-                        result = session.execute(text("""
-                            SELECT AVG(value)
-                            FROM sensor_readings
-                            WHERE date(timestamp) = :date_only
-                              AND sensor = :sensor_name
-                        """), {
-                            "date_only": date_only,
-                            "sensor_name": sensor_names[0]
-                        }).fetchone()
-
-                    if result and result[0] is not None:
-                        sensor_data[key] = float(result[0])
+                row = session.execute(text("""
+                    SELECT
+                        AVG(CASE WHEN sensor = 'ph' THEN value END) AS ave_ph,
+                        AVG(CASE WHEN sensor IN ('do_mg_per_l', 'do_mg_l') THEN value END) AS ave_do,
+                        AVG(CASE WHEN sensor = 'tds_ppm' THEN value END) AS ave_tds,
+                        AVG(CASE WHEN sensor = 'temperature_c' THEN value END) AS ave_temp,
+                        AVG(CASE WHEN sensor = 'humidity' THEN value END) AS ave_humidity
+                    FROM sensor_readings
+                    WHERE date(timestamp) = :date_only
+                      AND sensor IN ('ph', 'do_mg_per_l', 'do_mg_l', 'tds_ppm',
+                                     'temperature_c', 'humidity')
+                """), {"date_only": date_only}).mappings().first()
+
+            if row:
+                sensor_data = {key: float(val) for key, val in row.items() if val is not None}
 
             # If no sensor data found, use defaults
             if not sensor_data:
@@ -1254,7 +1280,7 @@ def predict_plant_growth():
                 sensor_source = "default"
         
         # Load predictor and make predictions
-        predictor = PlantGrowthPredictor()
+        predictor = get_growth_predictor()
         if not predictor.is_available(farming_system):
             return jsonify({
                 "success": False,
@@ -9,21 +9,27 @@ logger = logging.getLogger("collector")
 
 SAMPLE_INTERVAL = 30  # seconds
 
-def insert(session, sensor: str, value: float, unit: str = None, meta: dict = None):
-    r = SensorReading(timestamp=datetime.now(timezone.utc), sensor=sensor, value=value, unit=unit, meta=meta)
-    session.add(r)
+_SENSOR_INSERT = SensorReading.__table__.insert()
+
+def insert(rows: list, ts: datetime, sensor: str, value: float, unit: str = None, meta: dict = None):
+    rows.append({"timestamp": ts, "sensor": sensor, "value": value, "unit": unit, "meta": meta})
 
 def collect_once(session):
+    # Readings of one cycle share a timestamp and go to the DB in a single executemany
+    ts = datetime.now(timezone.utc)
+    rows = []
     b = read_bme()
     if b:
-        insert(session, "temperature_c", b["temperature_c"], "C", {"source": "bme280"})
-        insert(session, "humidity", b["humidity"], "%", {"source": "bme280"})
-        insert(session, "pressure_hpa", b["pressure_hpa"], "hPa", {"source": "bme280"})
+        insert(rows, ts, "temperature_c", b["temperature_c"], "C", {"source": "bme280"})
+        insert(rows, ts, "humidity", b["humidity"], "%", {"source": "bme280"})
+        insert(rows, ts, "pressure_hpa", b["pressure_hpa"], "hPa", {"source": "bme280"})
     a = read_analog()
     if a:  # Only insert analog data if available
-        insert(session, "ph", a["ph"], "pH", {"voltage": a["ph_voltage"]})
-        insert(session, "tds_ppm", a["tds_ppm"], "ppm", {"voltage": a["tds_voltage"]})
-        insert(session, "do_mg_per_l", a["do_mg_per_l"], "mg/L", {"voltage": a["do_voltage"]})
+        insert(rows, ts, "ph", a["ph"], "pH", {"voltage": a["ph_voltage"]})
+        insert(rows, ts, "tds_ppm", a["tds_ppm"], "ppm", {"voltage": a["tds_voltage"]})
+        insert(rows, ts, "do_mg_per_l", a["do_mg_per_l"], "mg/L", {"voltage": a["do_voltage"]})
+    if rows:
+        session.execute(_SENSOR_INSERT, rows)
     session.commit()
 
 def main():
@@ -1,5 +1,7 @@
 import os
-from sqlalchemy import create_engine, Column, Integer, Float, Text, TIMESTAMP, JSON
+import json
+from sqlalchemy import create_engine, text, Column, Integer, Float, Text, TIMESTAMP, JSON
+from sqlalchemy.types import TypeDecorator
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.sql import func
@@ -14,17 +16,68 @@ if DB_URL.startswith("sqlite"):
 engine = create_engine(DB_URL, echo=False, future=True, connect_args=_connect_args)
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
 
-# Enable WAL mode for SQLite (allows concurrent reads + writes)
-if DB_URL.startswith("sqlite"):
+def enable_sqlite_pragmas(sqlite_engine):
+    """Tune every new SQLite connection of ``sqlite_engine``.
+
+    WAL allows concurrent reads + writes; synchronous=NORMAL makes a commit a
+    WAL append with no fsync (only checkpoints fsync), which is what keeps
+    per-batch commits cheap on the Pi's SD card. wal_autocheckpoint bounds
+    WAL growth.
+    """
     from sqlalchemy import event
-    @event.listens_for(engine, "connect")
+
+    @event.listens_for(sqlite_engine, "connect")
     def _set_sqlite_pragma(dbapi_conn, connection_record):
         cursor = dbapi_conn.cursor()
         cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
         cursor.execute("PRAGMA busy_timeout=10000")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.execute("PRAGMA mmap_size=67108864")  # 64 MiB
+        cursor.execute("PRAGMA wal_autocheckpoint=1000")
         cursor.close()
+
+if DB_URL.startswith("sqlite"):
+    enable_sqlite_pragmas(engine)
 Base = declarative_base()
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class ORJSON(TypeDecorator):
+    """JSON column encoded with orjson on SQLite (stdlib json fallback).
+
+    Stdlib json in SQLAlchemy's JSON type is the slow part of bulk inserts
+    on the Pi; SQLite stores JSON as text anyway, so the column is TEXT
+    there with the same on-disk format. Every other dialect keeps its
+    native JSON type (json on Postgres) and its own serialization.
+    """
+    impl = Text
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == "sqlite":
+            return dialect.type_descriptor(Text())
+        return dialect.type_descriptor(JSON())
+
+    def process_bind_param(self, value, dialect):
+        if value is None or dialect.name != "sqlite":
+            return value
+        if orjson is not None:
+            return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS).decode()
+        return json.dumps(value)
+
+    def process_result_value(self, value, dialect):
+        if dialect.name != "sqlite" or not isinstance(value, (str, bytes)):
+            return value
+        if not value:
+            return None
+        return orjson.loads(value) if orjson is not None else json.loads(value)
+
+
 class SensorReading(Base):
     __tablename__ = "sensor_readings"
     id = Column(Integer, primary_key=True)
@@ -32,7 +85,7 @@ class SensorReading(Base):
     sensor = Column(Text, nullable=False)
     value = Column(Float)
     unit = Column(Text)
-    meta = Column(JSON)
+    meta = Column(ORJSON)
 
 class PlantReading(Base):
     __tablename__ = "plant_readings"
@@ -68,6 +121,26 @@ class MLPrediction(Base):
 
 def init_db():
     Base.metadata.create_all(bind=engine)
+    ensure_sensor_indexes(engine)
+
+def ensure_sensor_indexes(target_engine):
+    """Create the sensor_readings lookup indexes on existing databases too.
+
+    (sensor, timestamp) serves the "latest value per sensor" and time-range
+    queries; on SQLite an expression index on (date(timestamp), sensor) lets
+    the per-day ML averages read one day instead of scanning the table.
+    (PostgreSQL can't index date() of a timestamptz: it is not immutable.)
+    """
+    statements = [
+        "CREATE INDEX IF NOT EXISTS idx_sr_sensor_ts ON sensor_readings (sensor, timestamp)",
+    ]
+    if target_engine.dialect.name == "sqlite":
+        statements.append(
+            "CREATE INDEX IF NOT EXISTS idx_sr_day_sensor ON sensor_readings (date(timestamp), sensor)"
+        )
+    with target_engine.begin() as conn:
+        for stmt in statements:
+            conn.execute(text(stmt))
 
 def get_session():
     return SessionLocal()
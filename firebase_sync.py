@@ -20,15 +20,33 @@ Requires:
 import os
 import json
 import time
+import operator
+import queue
 import serial
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry as HTTPRetry
 import threading
+from collections import deque
 from datetime import datetime, timezone, timedelta
 from pathlib import Path
 
+# orjson parses the raw serial bytes directly; its error subclasses ValueError
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
 try:
     import firebase_admin
     from firebase_admin import credentials, firestore
     from google.api_core.retry import Retry
+    from google.cloud.firestore_v1.base_query import FieldFilter
+    from google.api_core.exceptions import (
+        ResourceExhausted, DeadlineExceeded, ServiceUnavailable,
+        TooManyRequests, GatewayTimeout, GoogleAPICallError,
+    )
 except ImportError:
     print("ERROR: firebase-admin not installed. Run: pip install firebase-admin")
     exit(1)
@@ -57,6 +75,16 @@ HISTORY_SYNC_CYCLES = max(1, int(round(900 / max(SYNC_INTERVAL, 1))))     # ~15
 CAL_UPDATE_CYCLES = max(1, int(round(600 / max(SYNC_INTERVAL, 1))))       # ~10 min
 FAST_FIRST_HISTORY_CYCLE = max(2, int(round(30 / max(SYNC_INTERVAL, 1)))) # ~30s after start
 
+# Persistent keep-alive session for local API calls (serial ingest, relay,
+# override/time-mode) instead of a fresh TCP connection per request.
+_api_session = requests.Session()
+_api_session.mount("http://", HTTPAdapter(
+    pool_connections=1,
+    pool_maxsize=4,
+    # connect-level retries only: a POST is never re-sent once it reached the API
+    max_retries=HTTPRetry(total=2, read=0, backoff_factor=0.2),
+))
+
 # Auto-detect serial port (prefer ttyUSB1 which is more stable on this system)
 def _auto_detect_serial():
     import glob
@@ -117,8 +145,23 @@ class QuotaTracker:
 quota = QuotaTracker()
 
 
+_QUOTA_ERROR_TYPES = (
+    ResourceExhausted, DeadlineExceeded, ServiceUnavailable,
+    TooManyRequests, GatewayTimeout,
+)
+
+
 def _is_quota_error(e: Exception) -> bool:
-    """Return True if the error is a Firestore quota / rate-limit / overload issue."""
+    """Return True if the error is a Firestore quota / rate-limit / overload issue.
+
+    Matches the concrete google.api_core exception types first; the string
+    scan is only a fallback for errors raised outside the API core layer
+    (e.g. raw gRPC errors), so typed API errors never pay for str(e).
+    """
+    if isinstance(e, _QUOTA_ERROR_TYPES):
+        return True
+    if isinstance(e, GoogleAPICallError):
+        return False
     s = str(e)
     return any(k in s for k in ("429", "Quota", "RESOURCE_EXHAUSTED", "503", "504", "Deadline"))
 
@@ -126,15 +169,18 @@ def _is_quota_error(e: Exception) -> bool:
 # Global serial connection (shared with relay control)
 serial_lock = threading.Lock()
 serial_conn = None
+_serial_opened_once = False  # boot noise is only flushed on the very first open
 
 def get_serial():
     """Get or create serial connection."""
-    global serial_conn
+    global serial_conn, _serial_opened_once
     if serial_conn is None or not serial_conn.is_open:
         try:
             serial_conn = serial.Serial(SERIAL_PORT, BAUD_RATE, timeout=1)
-            time.sleep(0.5)
-            serial_conn.reset_input_buffer()
+            if not _serial_opened_once:
+                time.sleep(0.5)
+                serial_conn.reset_input_buffer()
+                _serial_opened_once = True
         except Exception as e:
             print(f"  ⚠️ Serial not available: {e}")
             return None
@@ -153,6 +199,32 @@ _SERIAL_KEY_MAP = {
     "do_v": "do_voltage_v",
     "tds_v": "tds_voltage_v",
 }
+_SERIAL_API_KEYS = tuple(_SERIAL_KEY_MAP.values())
+_serial_getter = operator.itemgetter(*_SERIAL_KEY_MAP)
+
+
+def _map_serial_readings(readings: dict) -> dict:
+    """Map ESP32 serial keys to API keys.
+
+    Fast path fetches every key in one itemgetter call when the ESP32 sent
+    the full schema; partial payloads fall back to a per-key comprehension.
+    """
+    try:
+        return dict(zip(_SERIAL_API_KEYS, _serial_getter(readings)))
+    except KeyError:
+        return {ak: readings[sk] for sk, ak in _SERIAL_KEY_MAP.items() if sk in readings}
+
+# Relay-command responses: the reader thread owns all serial reads and routes
+# non-JSON lines (ACK/OK/ERROR) to send_relay_command through this queue.
+_resp_q = queue.Queue()
+_reader_wake = threading.Event()  # set by send_relay_command to wake the reader immediately
+_resp_window_until = 0.0          # monotonic deadline while a relay response is expected
+_RELAY_RESP_TIMEOUT = 0.5         # seconds of silence that ends a relay response
+_serial_reader_active = False
+
+_ingest_q = queue.Queue(maxsize=32)  # serial snapshots waiting to be POSTed to /api/ingest
+
+_SERIAL_MAX_LINES_PER_READ = 256  # cap per-iteration buffer (only the latest reading is used anyway)
 _serial_ingest_interval = 2  # POST to /api/ingest every 2s for near real-time updates
 _last_serial_ingest_ts = 0
 _last_serial_readings = {}  # latest parsed readings from serial
@@ -203,29 +275,76 @@ def _reset_esp32_via_dtr():
         return False
 
 
+def _serial_ingest_worker():
+    """Background thread: POST queued serial snapshots to /api/ingest.
+
+    Keeps HTTP latency (up to the 5s timeout) off the serial reader so a slow
+    API never stalls serial reads or relay-response routing.
+    """
+    while True:
+        payload = _ingest_q.get()
+        try:
+            resp = _api_session.post(
+                "http://localhost:5000/api/ingest",
+                json=payload,
+                timeout=5,
+            )
+            if resp.ok:
+                r = resp.json()
+                if r.get("inserted", 0) > 0:
+                    print(f"  📡 Serial→API: {r.get('inserted')} readings ingested")
+            else:
+                print(f"  ⚠️ Serial ingest error: HTTP {resp.status_code}")
+        except Exception as e:
+            print(f"  ⚠️ Serial ingest error: {e}")
+
+
 def _serial_reader_thread():
     """Background thread: read ESP32 serial JSON, POST to /api/ingest periodically."""
-    global _last_serial_ingest_ts, _last_serial_readings
-    import requests
+    global _last_serial_ingest_ts, _last_serial_readings, _serial_reader_active
 
+    _serial_reader_active = True
+    threading.Thread(target=_serial_ingest_worker, daemon=True).start()
     print("  📡 Serial sensor reader thread started", flush=True)
     _no_data_count = 0
     while True:
         try:
-            lines = []
+            # Bounded: on a serial burst only the newest lines are kept
+            lines = deque(maxlen=_SERIAL_MAX_LINES_PER_READ)
+            read_count = 0
             with serial_lock:
                 ser = get_serial()
                 if not ser:
                     time.sleep(2)
                     continue
-                # Read all available lines (non-blocking, timeout=1 already set)
-                while ser.in_waiting:
+                # Read all available lines; while a relay response is expected,
+                # block in readline (timeout=1) instead of returning early
+                # JSON frames are filtered on their first byte and kept as bytes
+                # (parsed as bytes); only relay responses get decoded.
+                while True:
                     try:
-                        line = ser.readline().decode('utf-8', errors='ignore').strip()
-                        if line:
-                            lines.append(line)
+                        # in_waiting hits the port too and raises OSError once it is unplugged
+                        if not (ser.in_waiting or time.monotonic() < _resp_window_until):
+                            break
+                        raw = ser.read_until(b'\n').strip()
+                    except (serial.SerialException, OSError) as e:
+                        # Port is gone (USB reset etc.) — close so get_serial() reopens it
+                        print(f"  ⚠️ Serial read failed, reopening: {e}", flush=True)
+                        ser.close()
+                        break
                     except Exception:
                         break
+                    if not raw:
+                        continue
+                    if raw[:1] == b'{':
+                        lines.append(raw)
+                        read_count += 1
+                    elif time.monotonic() < _resp_window_until:
+                        _resp_q.put(raw.decode('utf-8', errors='ignore'))
+
+            dropped = read_count - len(lines)
+            if dropped > 0:
+                print(f"  ⚠️ Serial reader: burst overflow, dropped {dropped} oldest lines", flush=True)
 
             if lines:
                 _no_data_count = 0
@@ -243,11 +362,10 @@ def _serial_reader_thread():
 
             # Parse JSON sensor lines
             for line in lines:
-                if not line.startswith('{'):
-                    continue
                 try:
-                    data = json.loads(line)
-                except json.JSONDecodeError:
+                    data = _json_loads(line)
+                except ValueError:
+                    # Bad JSON or invalid UTF-8 (UnicodeDecodeError) from line noise
                     continue
 
                 readings = data.get("readings")
@@ -255,10 +373,7 @@ def _serial_reader_thread():
                     continue
 
                 # Map serial keys to API keys
-                mapped = {}
-                for sk, ak in _SERIAL_KEY_MAP.items():
-                    if sk in readings:
-                        mapped[ak] = readings[sk]
+                mapped = _map_serial_readings(readings)
 
                 if mapped:
                     _last_serial_readings = mapped
@@ -267,33 +382,68 @@ def _serial_reader_thread():
             now = time.time()
             if _last_serial_readings and (now - _last_serial_ingest_ts >= _serial_ingest_interval):
                 _last_serial_ingest_ts = now
+                payload = {
+                    "device": "esp32-serial",
+                    "key": "espkey123",
+                    "readings": dict(_last_serial_readings),
+                }
                 try:
-                    payload = {
-                        "device": "esp32-serial",
-                        "key": "espkey123",
-                        "readings": dict(_last_serial_readings),
-                    }
-                    resp = requests.post(
-                        "http://localhost:5000/api/ingest",
-                        json=payload,
-                        timeout=5,
-                    )
-                    if resp.ok:
-                        r = resp.json()
-                        if r.get("inserted", 0) > 0:
-                            print(f"  📡 Serial→API: {r.get('inserted')} readings ingested")
-                    else:
-                        print(f"  ⚠️ Serial ingest error: HTTP {resp.status_code}")
-                except Exception as e:
-                    print(f"  ⚠️ Serial ingest error: {e}")
+                    _ingest_q.put_nowait(payload)
+                except queue.Full:
+                    print("  ⚠️ Serial ingest queue full (API stalled), dropping snapshot")
 
         except Exception as e:
             print(f"  ⚠️ Serial reader error: {e}")
 
-        time.sleep(1)  # Read serial every 1s
+        # Read serial every 1s, or immediately when a relay command was sent
+        _reader_wake.wait(1)
+        _reader_wake.clear()
 
 def send_relay_command(cmd: str) -> str:
-    """Send command to ESP32 and return response."""
+    """Send command to ESP32 and return response.
+
+    When the serial reader thread is running, it reads the response and
+    hands it over via _resp_q; this thread just blocks on the queue.
+    """
+    global _resp_window_until
+    if not _serial_reader_active:
+        return _send_relay_command_direct(cmd)
+
+    with serial_lock:
+        ser = get_serial()
+        if not ser:
+            return "ERROR: Serial not available"
+
+        # Discard responses left over from a previous, timed-out command
+        try:
+            while True:
+                _resp_q.get_nowait()
+        except queue.Empty:
+            pass
+
+        try:
+            ser.write((cmd + "\n").encode())
+            ser.flush()
+        except Exception as e:
+            return f"ERROR: {e}"
+        _resp_window_until = time.monotonic() + _RELAY_RESP_TIMEOUT
+
+    _reader_wake.set()
+    response_lines = []
+    while True:
+        try:
+            line = _resp_q.get(timeout=_RELAY_RESP_TIMEOUT)
+        except queue.Empty:
+            break
+        response_lines.append(line)
+        _resp_window_until = time.monotonic() + _RELAY_RESP_TIMEOUT  # multi-line reply
+    _resp_window_until = 0.0
+
+    return "\n".join(response_lines) if response_lines else "OK"
+
+
+def _send_relay_command_direct(cmd: str) -> str:
+    """Send command and read the response inline (no serial reader thread)."""
     with serial_lock:
         ser = get_serial()
         if not ser:
@@ -316,6 +466,10 @@ def send_relay_command(cmd: str) -> str:
                     time.sleep(0.01)
             
             return "\n".join(response_lines) if response_lines else "OK"
+        except (serial.SerialException, OSError) as e:
+            # Port is gone — close so the next get_serial() reopens it
+            ser.close()
+            return f"ERROR: {e}"
         except Exception as e:
             return f"ERROR: {e}"
 
@@ -443,12 +597,88 @@ def sync_latest_to_firebase(db: firestore.Client, session):
 
 _relay_cmd_override_synced = False  # Track if we've already synced override for this batch
 
+def _handle_relay_command(doc, now_utc: datetime):
+    """Execute one pending relay_commands document via the API and record the result."""
+    global _relay_cmd_override_synced
+    cmd_data = doc.to_dict()
+    relay = cmd_data.get("relay", "").upper()  # e.g., "R1"
+    action = cmd_data.get("action", "").lower()  # "on" or "off"
+
+    # Drop stale pending commands so old queue entries don't fight current manual control.
+    try:
+        created_at = cmd_data.get("created_at")
+        created_dt = None
+        if isinstance(created_at, datetime):
+            created_dt = created_at if created_at.tzinfo else created_at.replace(tzinfo=timezone.utc)
+        elif hasattr(created_at, "timestamp"):
+            created_dt = datetime.fromtimestamp(created_at.timestamp(), tz=timezone.utc)
+
+        if created_dt is not None:
+            age_s = (now_utc - created_dt).total_seconds()
+            if age_s > RELAY_COMMAND_TTL_SEC:
+                doc.reference.update({
+                    "status": "expired",
+                    "response": f"Expired (age={int(age_s)}s > ttl={RELAY_COMMAND_TTL_SEC}s)",
+                    "executed_at": firestore.SERVER_TIMESTAMP,
+                }, timeout=FIRESTORE_TIMEOUT, retry=FIRESTORE_RETRY)
+                return
+    except Exception:
+        pass
+    
+    # Extract relay number (R1 -> 1)
+    try:
+        relay_num = int(relay.replace("R", ""))
+    except:
+        doc.reference.update({"status": "error", "response": f"Invalid relay: {relay}"}, timeout=FIRESTORE_TIMEOUT, retry=FIRESTORE_RETRY)
+        return
+    
+    # Dashboard relay command implies manual control — enable override
+    # so automation doesn't immediately overwrite the user's action.
+    # The override toggle on Vercel syncs via settings/override_mode but
+    # that path is slower (checked every 30s). This makes it instant.
+    if not _relay_cmd_override_synced:
+        try:
+            ov_resp = _api_session.get("http://localhost:5000/api/override-mode", timeout=2)
+            if ov_resp.ok:
+                ov_data = ov_resp.json() or {}
+                ov_enabled = bool(ov_data.get("enabled", ov_data.get("override_mode", False)))
+            else:
+                ov_enabled = False
+            if not ov_enabled:
+                _api_session.post(
+                    "http://localhost:5000/api/override-mode",
+                    json={"enabled": True},
+                    timeout=2,
+                )
+                print("  🔒 Auto-enabled override (dashboard relay command)")
+                _save_override_processed(True)
+        except Exception as e:
+            print(f"  ⚠️ Could not auto-enable override: {e}")
+        _relay_cmd_override_synced = True
+    
+    print(f"  🔌 Relay command: R{relay_num} {action.upper()}")
+    
+    # Use API to update relay state (ESP32 polls this)
+    try:
+        api_url = f"http://localhost:5000/api/relay/{relay_num}/{action}"
+        resp = _api_session.post(api_url, timeout=5)  # Increased timeout for reliability
+        response = resp.json() if resp.ok else f"API error: {resp.status_code}"
+    except Exception as e:
+        response = f"API error: {e}"
+    
+    # Update command status
+    doc.reference.update({
+        "status": "executed",
+        "response": str(response),
+        "executed_at": firestore.SERVER_TIMESTAMP
+    }, timeout=FIRESTORE_TIMEOUT, retry=FIRESTORE_RETRY)
+    print(f"    → {response}")
+
+
 def process_relay_commands(db: firestore.Client):
     """Check for pending relay commands and execute them via API.
     Returns True if any commands were processed."""
     global _relay_cmd_override_synced
-    import requests
-    from google.cloud.firestore_v1.base_query import FieldFilter
     
     commands_ref = db.collection("relay_commands")
     
@@ -459,79 +689,7 @@ def process_relay_commands(db: firestore.Client):
     now_utc = datetime.now(timezone.utc)
     for doc in pending:
         had_commands = True
-        cmd_data = doc.to_dict()
-        relay = cmd_data.get("relay", "").upper()  # e.g., "R1"
-        action = cmd_data.get("action", "").lower()  # "on" or "off"
-
-        # Drop stale pending commands so old queue entries don't fight current manual control.
-        try:
-            created_at = cmd_data.get("created_at")
-            created_dt = None
-            if isinstance(created_at, datetime):
-                created_dt = created_at if created_at.tzinfo else created_at.replace(tzinfo=timezone.utc)
-            elif hasattr(created_at, "timestamp"):
-                created_dt = datetime.fromtimestamp(created_at.timestamp(), tz=timezone.utc)
-
-            if created_dt is not None:
-                age_s = (now_utc - created_dt).total_seconds()
-                if age_s > RELAY_COMMAND_TTL_SEC:
-                    doc.reference.update({
-                        "status": "expired",
-                        "response": f"Expired (age={int(age_s)}s > ttl={RELAY_COMMAND_TTL_SEC}s)",
-                        "executed_at": firestore.SERVER_TIMESTAMP,
-                    }, timeout=FIRESTORE_TIMEOUT, retry=FIRESTORE_RETRY)
-                    continue
-        except Exception:
-            pass
-        
-        # Extract relay number (R1 -> 1)
-        try:
-            relay_num = int(relay.replace("R", ""))
-        except:
-            doc.reference.update({"status": "error", "response": f"Invalid relay: {relay}"}, timeout=FIRESTORE_TIMEOUT, retry=FIRESTORE_RETRY)
-            continue
-        
-        # Dashboard relay command implies manual control — enable override
-        # so automation doesn't immediately overwrite the user's action.
-        # The override toggle on Vercel syncs via settings/override_mode but
-        # that path is slower (checked every 30s). This makes it instant.
-        if not _relay_cmd_override_synced:
-            try:
-                ov_resp = requests.get("http://localhost:5000/api/override-mode", timeout=2)
-                if ov_resp.ok:
-                    ov_data = ov_resp.json() or {}
-                    ov_enabled = bool(ov_data.get("enabled", ov_data.get("override_mode", False)))
-                else:
-                    ov_enabled = False
-                if not ov_enabled:
-                    requests.post(
-                        "http://localhost:5000/api/override-mode",
-                        json={"enabled": True},
-                        timeout=2,
-                    )
-                    print("  🔒 Auto-enabled override (dashboard relay command)")
-                    _save_override_processed(True)
-            except Exception as e:
-                print(f"  ⚠️ Could not auto-enable override: {e}")
-            _relay_cmd_override_synced = True
-        
-        print(f"  🔌 Relay command: R{relay_num} {action.upper()}")
-        
-        # Use API to update relay state (ESP32 polls this)
-        try:
-            api_url = f"http://localhost:5000/api/relay/{relay_num}/{action}"
-            resp = requests.post(api_url, timeout=5)  # Increased timeout for reliability
-            response = resp.json() if resp.ok else f"API error: {resp.status_code}"
-        except Exception as e:
-            response = f"API error: {e}"
-        
-        # Update command status
-        doc.reference.update({
-            "status": "executed",
-            "response": str(response),
-            "executed_at": firestore.SERVER_TIMESTAMP
-        }, timeout=FIRESTORE_TIMEOUT, retry=FIRESTORE_RETRY)
-        print(f"    → {response}")
+        _handle_relay_command(doc, now_utc)
     
     # Reset the flag when no commands (user switched back to auto)
     if not had_commands:
@@ -540,11 +698,40 @@ def process_relay_commands(db: firestore.Client):
     return had_commands
 
 
+_relay_cmd_lock = threading.Lock()  # serializes listener callbacks with any fallback polling
+
+
+def start_relay_command_listener(db: firestore.Client):
+    """Subscribe to pending relay commands with on_snapshot.
+
+    Firestore pushes new pending documents over the existing gRPC stream, so
+    relay detection costs one read per command instead of one query every
+    ~5s. Returns the Watch handle (call .unsubscribe() to stop).
+    """
+    query = db.collection("relay_commands").where(filter=FieldFilter("status", "==", "pending"))
+
+    def _on_relay_snapshot(col_snapshot, changes, read_time):
+        global _relay_cmd_override_synced
+        with _relay_cmd_lock:
+            now_utc = datetime.now(timezone.utc)
+            for change in changes:
+                if change.type.name != "ADDED":
+                    continue  # MODIFIED/REMOVED: our own status updates
+                try:
+                    _handle_relay_command(change.document, now_utc)
+                except Exception as e:
+                    print(f"  ⚠️ Relay error: {e}")
+            # Reset the flag when no commands are pending (user switched back to auto)
+            if not col_snapshot:
+                _relay_cmd_override_synced = False
+
+    return query.on_snapshot(_on_relay_snapshot)
+
+
 def get_relay_status() -> dict:
     """Get current relay status from API."""
-    import requests
     try:
-        resp = requests.get("http://localhost:5000/api/relay/pending", timeout=2)
+        resp = _api_session.get("http://localhost:5000/api/relay/pending", timeout=2)
         if resp.ok:
             data = resp.json()
             states_str = data.get("states", "")
@@ -620,15 +807,37 @@ def _save_override_processed(enabled: bool):
     except Exception:
         pass
 
-def check_override_mode(db: firestore.Client, last_override_state: bool) -> bool:
+# Main-loop op name -> settings/* document it polls
+_SETTINGS_DOCS = {
+    "override": "override_mode",
+    "timemode": "time_mode",
+    "calmode": "calibration_mode",
+    "cal_update": "calibration",
+}
+
+
+def fetch_settings_docs(db: firestore.Client, ops: list) -> dict:
+    """Fetch the settings/* documents for the given ops in one get_all RPC.
+    Returns {op: DocumentSnapshot}."""
+    settings_ref = db.collection("settings")
+    op_by_doc_id = {_SETTINGS_DOCS[op]: op for op in ops}
+    refs = [settings_ref.document(doc_id) for doc_id in op_by_doc_id]
+    snapshots = db.get_all(refs, timeout=FIRESTORE_TIMEOUT, retry=FIRESTORE_RETRY)
+    return {op_by_doc_id[snap.id]: snap for snap in snapshots}
+
+
+def check_override_mode(db: firestore.Client, last_override_state: bool, doc=None) -> bool:
     """Check if override mode was changed from dashboard via Firebase.
-    Returns the current override state."""
+    Returns the current override state.
+
+    ``doc`` is an already-fetched settings/override_mode snapshot; when
+    omitted the document is read here."""
     global _last_seen_override_doc_version
-    import requests
     
     try:
-        doc_ref = db.collection("settings").document("override_mode")
-        doc = doc_ref.get(timeout=FIRESTORE_TIMEOUT, retry=FIRESTORE_RETRY)
+        if doc is None:
+            doc_ref = db.collection("settings").document("override_mode")
+            doc = doc_ref.get(timeout=FIRESTORE_TIMEOUT, retry=FIRESTORE_RETRY)
         
         if doc.exists:
             data = doc.to_dict()
@@ -668,7 +877,7 @@ def check_override_mode(db: firestore.Client, last_override_state: bool) -> bool
                 # Read live API state to avoid overwriting recent local/LAN changes.
                 current_api_state = last_override_state
                 try:
-                    api_state_resp = requests.get("http://localhost:5000/api/override-mode", timeout=2)
+                    api_state_resp = _api_session.get("http://localhost:5000/api/override-mode", timeout=2)
                     if api_state_resp.ok:
                         api_data = api_state_resp.json() or {}
                         current_api_state = bool(api_data.get("enabled", api_data.get("override_mode", last_override_state)))
@@ -681,7 +890,7 @@ def check_override_mode(db: firestore.Client, last_override_state: bool) -> bool
                 
                 print(f"  🔒 Override mode changed from dashboard: {'ON' if enabled else 'OFF'}")
                 try:
-                    resp = requests.post(
+                    resp = _api_session.post(
                         "http://localhost:5000/api/override-mode",
                         json={"enabled": enabled},
                         timeout=2
@@ -705,14 +914,14 @@ def check_override_mode(db: firestore.Client, last_override_state: bool) -> bool
         raise  # re-raise so main loop backoff can handle it
 
 
-def check_calibration_mode(db: firestore.Client, last_cal_mode_state: bool) -> bool:
+def check_calibration_mode(db: firestore.Client, last_cal_mode_state: bool, doc=None) -> bool:
     """Check if calibration mode was changed from dashboard via Firebase.
     Returns the current calibration mode state."""
-    import requests
 
     try:
-        doc_ref = db.collection("settings").document("calibration_mode")
-        doc = doc_ref.get(timeout=FIRESTORE_TIMEOUT, retry=FIRESTORE_RETRY)
+        if doc is None:
+            doc_ref = db.collection("settings").document("calibration_mode")
+            doc = doc_ref.get(timeout=FIRESTORE_TIMEOUT, retry=FIRESTORE_RETRY)
 
         if doc.exists:
             data = doc.to_dict()
@@ -722,7 +931,7 @@ def check_calibration_mode(db: firestore.Client, last_cal_mode_state: bool) -> b
             if source == "dashboard" and enabled != last_cal_mode_state:
                 print(f"  🔧 Calibration mode changed from dashboard: {'ON' if enabled else 'OFF'}")
                 try:
-                    resp = requests.post(
+                    resp = _api_session.post(
                         "http://localhost:5000/api/calibration-mode",
                         json={"enabled": enabled},
                         timeout=2
@@ -742,15 +951,15 @@ def check_calibration_mode(db: firestore.Client, last_cal_mode_state: bool) -> b
         raise  # re-raise so main loop backoff can handle it
 
 
-def check_time_mode(db: firestore.Client, last_time_mode: str) -> str:
+def check_time_mode(db: firestore.Client, last_time_mode: str, doc=None) -> str:
     """Check if time mode was changed from dashboard via Firebase.
     Returns current time mode: normal | morning | night."""
     global _last_seen_time_mode_doc_version
-    import requests
 
     try:
-        doc_ref = db.collection("settings").document("time_mode")
-        doc = doc_ref.get(timeout=FIRESTORE_TIMEOUT, retry=FIRESTORE_RETRY)
+        if doc is None:
+            doc_ref = db.collection("settings").document("time_mode")
+            doc = doc_ref.get(timeout=FIRESTORE_TIMEOUT, retry=FIRESTORE_RETRY)
 
         if doc.exists:
             data = doc.to_dict() or {}
@@ -781,7 +990,7 @@ def check_time_mode(db: firestore.Client, last_time_mode: str) -> str:
                 # Read live API state to avoid unnecessary writes
                 current_api_mode = last_time_mode
                 try:
-                    api_state_resp = requests.get("http://localhost:5000/api/time-mode", timeout=2)
+                    api_state_resp = _api_session.get("http://localhost:5000/api/time-mode", timeout=2)
                     if api_state_resp.ok:
                         api_data = api_state_resp.json() or {}
                         current_api_mode = str(api_data.get("mode", last_time_mode)).strip().lower()
@@ -793,7 +1002,7 @@ def check_time_mode(db: firestore.Client, last_time_mode: str) -> str:
 
                 print(f"  🕒 Time mode changed from dashboard: {mode.upper()}")
                 try:
-                    resp = requests.post(
+                    resp = _api_session.post(
                         "http://localhost:5000/api/time-mode",
                         json={"mode": mode},
                         timeout=2,
@@ -811,10 +1020,11 @@ def check_time_mode(db: firestore.Client, last_time_mode: str) -> str:
         raise
 
 
-def check_calibration_updates(db: firestore.Client, last_cal_check: datetime) -> datetime:
+def check_calibration_updates(db: firestore.Client, last_cal_check: datetime, doc=None) -> datetime:
     """Check if calibration was updated from dashboard."""
-    doc_ref = db.collection("settings").document("calibration")
-    doc = doc_ref.get(timeout=FIRESTORE_TIMEOUT, retry=FIRESTORE_RETRY)
+    if doc is None:
+        doc_ref = db.collection("settings").document("calibration")
+        doc = doc_ref.get(timeout=FIRESTORE_TIMEOUT, retry=FIRESTORE_RETRY)
     
     if doc.exists:
         data = doc.to_dict()
@@ -848,7 +1058,7 @@ def sync_history_to_firebase(db: firestore.Client, session, last_sync_ts: dateti
     per sync (covers 12 hours of data) vs old approach that could never
     finish a multi-day backlog.
     """
-    from sqlalchemy import func as sa_func
+    from sqlalchemy import extract
 
     SENSOR_TYPES = ("ph", "do_mg_l", "tds_ppm", "temperature_c", "humidity")
     SENSOR_UNITS = {
@@ -856,6 +1066,7 @@ def sync_history_to_firebase(db: firestore.Client, session, last_sync_ts: dateti
         "temperature_c": "°C", "humidity": "%",
     }
     MAX_BUCKETS_PER_SYNC = 48  # ≤48 writes per sync to stay quota-friendly
+    HISTORY_BUCKET_SEC = 15 * 60
 
     # Ensure last_sync_ts is timezone-aware
     if last_sync_ts.tzinfo is None:
@@ -871,11 +1082,13 @@ def sync_history_to_firebase(db: firestore.Client, session, last_sync_ts: dateti
     if cutoff <= last_sync_ts:
         return last_sync_ts  # Nothing new to sync yet
 
-    # Query sensor readings between last_sync and cutoff (only relevant sensors)
+    # Query sensor readings between last_sync and cutoff (only relevant sensors).
+    # Timestamps come back as epoch seconds (strftime('%s') on SQLite,
+    # EXTRACT(EPOCH) on Postgres) so bucketing never builds datetimes.
     readings = (
         session.query(
             SensorReading.sensor,
-            SensorReading.timestamp,
+            extract("epoch", SensorReading.timestamp),
             SensorReading.value,
         )
         .filter(
@@ -887,56 +1100,53 @@ def sync_history_to_firebase(db: firestore.Client, session, last_sync_ts: dateti
         .yield_per(500)  # Stream in chunks to avoid loading millions into memory
     )
 
-    # Bucket readings into 15-min windows in Python
-    buckets = {}  # key: bucket_start_iso -> {sensor: [values]}
-    for sensor, ts, value in readings:
-        if value is None:
+    # Bucket readings into 15-min windows in Python, keyed by bucket-start
+    # epoch seconds (integer floor, no per-row datetime/ISO formatting)
+    buckets = {}  # key: bucket_start_epoch -> {sensor: [values]}
+    for sensor, epoch, value in readings:
+        if value is None or epoch is None:
             continue
-        # Make tz-aware
-        if ts.tzinfo is None:
-            ts = ts.replace(tzinfo=timezone.utc)
-        # Compute bucket start (floor to 15 min)
-        bucket_start = ts.replace(
-            minute=(ts.minute // 15) * 15, second=0, microsecond=0
-        )
-        bk = bucket_start.isoformat()
-        if bk not in buckets:
-            buckets[bk] = {"ts": bucket_start, "sensors": {}}
-        if sensor not in buckets[bk]["sensors"]:
-            buckets[bk]["sensors"][sensor] = []
-        buckets[bk]["sensors"][sensor].append(value)
+        epoch = int(epoch)
+        bk = epoch - epoch % HISTORY_BUCKET_SEC
+        sensors = buckets.get(bk)
+        if sensors is None:
+            sensors = buckets[bk] = {}
+        values = sensors.get(sensor)
+        if values is None:
+            sensors[sensor] = [value]
+        else:
+            values.append(value)
 
     if not buckets:
         return last_sync_ts
 
     # Sort by time, limit to MAX_BUCKETS_PER_SYNC oldest buckets first
-    sorted_keys = sorted(buckets.keys())[:MAX_BUCKETS_PER_SYNC]
+    sorted_keys = sorted(buckets)[:MAX_BUCKETS_PER_SYNC]
 
     batch = db.batch()
     batch_count = 0
     latest_bucket_end = last_sync_ts
 
     for bk in sorted_keys:
-        data = buckets[bk]
-        bucket_ts = data["ts"]
-
         # Average each sensor's values for this 15-min window
         readings_map = {}
-        for sensor, values in data["sensors"].items():
+        for sensor, values in buckets[bk].items():
             avg_val = sum(values) / len(values)
             readings_map[sensor] = {
                 "value": round(avg_val, 4),
                 "unit": SENSOR_UNITS.get(sensor, ""),
             }
 
-        # Doc ID like "2026-02-23T10-00-00_00-00" (safe for Firestore)
-        doc_id = bucket_ts.isoformat().replace(":", "-").replace("+", "_")
+        # Doc ID is the zero-padded bucket-start epoch, e.g. "1771840800"
+        # (deterministic, sorts chronologically, safe for Firestore)
+        doc_id = f"{bk:010d}"
         doc_ref = (
             db.collection("sensors")
             .document("history")
             .collection("readings")
             .document(doc_id)
         )
+        bucket_ts = datetime.fromtimestamp(bk, tz=timezone.utc)
         doc_data = {
             "timestamp": bucket_ts.isoformat(),
             "readings": readings_map,
@@ -945,7 +1155,7 @@ def sync_history_to_firebase(db: firestore.Client, session, last_sync_ts: dateti
         batch_count += 1
 
         # Track the END of this bucket (bucket_start + 15 min)
-        bucket_end = bucket_ts + timedelta(minutes=15)
+        bucket_end = datetime.fromtimestamp(bk + HISTORY_BUCKET_SEC, tz=timezone.utc)
         if bucket_end > latest_bucket_end:
             latest_bucket_end = bucket_end
 
@@ -983,19 +1193,19 @@ def sync_actuator_events_to_firebase(db: firestore.Client, session, last_actuato
     latest_ts = last_actuator_sync_ts
     batch_count = 0
 
-    for evt in events:
-        if batch_count >= BATCH_SIZE * 2:
-            break
-
+    # Events are ordered by timestamp, so the high-water mark is simply the
+    # last one written; each timestamp is formatted to ISO exactly once.
+    for evt in events[:BATCH_SIZE * 2]:
         evt_ts = evt.timestamp
         if evt_ts.tzinfo is None:
             evt_ts = evt_ts.replace(tzinfo=timezone.utc)
+        evt_iso = evt_ts.isoformat()
 
-        doc_id = f"r{evt.relay_id}_{evt_ts.isoformat().replace(':', '-').replace('+', '_')}"
+        doc_id = f"r{evt.relay_id}_{evt_iso.replace(':', '-').replace('+', '_')}"
         doc_ref = db.collection("actuators").document("history").collection("events").document(doc_id)
 
         doc_data = {
-            "timestamp": evt_ts.isoformat(),
+            "timestamp": evt_iso,
             "relay_id": evt.relay_id,
             "state": evt.state,
             "label": RELAY_LABELS.get(evt.relay_id, f"Relay {evt.relay_id}"),
@@ -1004,19 +1214,25 @@ def sync_actuator_events_to_firebase(db: firestore.Client, session, last_actuato
         batch.set(doc_ref, doc_data)
         batch_count += 1
 
-        if evt_ts > latest_ts:
-            latest_ts = evt_ts
-
     if batch_count > 0:
+        latest_ts = max(latest_ts, evt_ts)
         batch.commit(timeout=FIRESTORE_TIMEOUT, retry=FIRESTORE_RETRY)
         print(f"  Synced {batch_count} actuator events to Firebase")
 
     return latest_ts
 
 
+_LAST_SYNC_TS_FILE = Path(__file__).parent / ".firebase_last_sync_ts"
+_LAST_SYNC_PERSIST_MIN = timedelta(minutes=1)  # min advance before touching the SD card again
+_last_persisted_ts = None  # last timestamp actually written to disk
+_last_sync_ts_shadow = None  # in-memory resume point (may be ahead of disk)
+
+
 def load_last_sync_ts() -> datetime:
     """Load last sync timestamp from file."""
-    ts_file = Path(__file__).parent / ".firebase_last_sync_ts"
+    if _last_sync_ts_shadow is not None:
+        return _last_sync_ts_shadow
+    ts_file = _LAST_SYNC_TS_FILE
     if ts_file.exists():
         try:
             ts_str = ts_file.read_text().strip()
@@ -1028,9 +1244,20 @@ def load_last_sync_ts() -> datetime:
 
 
 def save_last_sync_ts(ts: datetime):
-    """Save last sync timestamp to file."""
-    ts_file = Path(__file__).parent / ".firebase_last_sync_ts"
-    ts_file.write_text(ts.isoformat())
+    """Save last sync timestamp to file.
+
+    Small advances (< 1 min) are kept in memory only; larger ones are
+    written to a temp file and atomically renamed over the cursor file so a
+    crash mid-write never leaves a truncated timestamp behind.
+    """
+    global _last_persisted_ts, _last_sync_ts_shadow
+    _last_sync_ts_shadow = ts
+    if _last_persisted_ts is not None and ts - _last_persisted_ts < _LAST_SYNC_PERSIST_MIN:
+        return
+    tmp = _LAST_SYNC_TS_FILE.with_suffix(".tmp")
+    tmp.write_text(ts.isoformat())
+    os.replace(tmp, _LAST_SYNC_TS_FILE)
+    _last_persisted_ts = ts
 
 
 def main():
@@ -1061,8 +1288,7 @@ def main():
     proxy_thread = threading.Thread(target=_start_serial_proxy, daemon=True)
     proxy_thread.start()
     print("✅ Serial proxy on port 5001")
-    import time as _time
-    _time.sleep(1)  # Give Flask time to start
+    time.sleep(1)  # Give Flask time to start
     
     # Initialize
     print(f"Loading service account from: {SERVICE_ACCOUNT_FILE}")
@@ -1083,6 +1309,15 @@ def main():
     else:
         print("⚠️ Serial not available (relay control disabled)")
     
+    # Relay commands are pushed by an on_snapshot listener; the ~5s poll in
+    # the main loop is only used if the listener can't start or dies.
+    relay_listener = None
+    try:
+        relay_listener = start_relay_command_listener(db)
+        print("✅ Relay command listener active")
+    except Exception as e:
+        print(f"⚠️ Relay listener unavailable, polling instead: {e}")
+
     last_sync_ts = load_last_sync_ts()
     # If last sync is too old, fast-forward to 48 hours ago to skip massive
     # backlogs that would waste quota on stale data.  History now uses 15-min
@@ -1103,8 +1338,7 @@ def main():
     last_override_state = False
     try:
         print("[DEBUG] Attempting to GET override-mode from API...")
-        import requests as _req
-        _resp = _req.get("http://localhost:5000/api/override-mode", timeout=2)
+        _resp = _api_session.get("http://localhost:5000/api/override-mode", timeout=2)
         print(f"[DEBUG] API responded: {_resp.status_code}")
         if _resp.ok:
             last_override_state = _resp.json().get("enabled", False)
@@ -1119,8 +1353,7 @@ def main():
     last_cal_mode_state = False  # Track calibration mode from dashboard
     last_time_mode = "normal"   # Track demo time mode from dashboard
     try:
-        import requests as _req
-        _tm = _req.get("http://localhost:5000/api/time-mode", timeout=2)
+        _tm = _api_session.get("http://localhost:5000/api/time-mode", timeout=2)
         if _tm.ok:
             last_time_mode = str((_tm.json() or {}).get("mode", "normal")).strip().lower()
     except Exception:
@@ -1148,26 +1381,23 @@ def main():
             def relay_callback(relay_id: int, state: bool):
                 """Callback to set relay state via API with retry."""
                 try:
-                    import requests as _req
                     action = "on" if state else "off"
                     # Increased timeout to 5s + retry logic for resilience
                     for attempt in range(2):
                         try:
-                            _resp = _req.post(f"http://localhost:5000/api/relay/{relay_id}/{action}", timeout=5)
+                            _resp = _api_session.post(f"http://localhost:5000/api/relay/{relay_id}/{action}", timeout=5)
                             if _resp.ok:
                                 return  # Success
                             elif _resp.status_code == 504:  # Deadline exceeded, retry
                                 if attempt == 0:
-                                    import time as _t
-                                    _t.sleep(0.1)
+                                    time.sleep(0.1)
                                     continue
                             else:
                                 print(f"⚠️ Relay {relay_id} set failed: {_resp.status_code}")
                                 return
                         except Exception as e:
                             if attempt == 0 and "timeout" in str(e).lower():
-                                import time as _t
-                                _t.sleep(0.1)
+                                time.sleep(0.1)
                                 continue
                             raise
                 except Exception as e:
@@ -1234,11 +1464,17 @@ def main():
                     if _is_quota_error(e) or "Timeout" in str(e):
                         quota.fail("latest", e)
             
-            # === PRIORITY 1: Relay commands (every ~5s) ===
+            # === PRIORITY 1: Relay commands (every ~5s, fallback only) ===
             # Needed for manual relay control from dashboard (override mode).
-            if sync_count % RELAY_CHECK_CYCLES == 0 and not quota.should_skip("relay"):
+            if relay_listener is not None and not relay_listener.is_active:
+                print("  ⚠️ Relay listener stopped — falling back to polling")
+                relay_listener = None
+            if (relay_listener is None
+                    and sync_count % RELAY_CHECK_CYCLES == 0
+                    and not quota.should_skip("relay")):
                 try:
-                    process_relay_commands(db)
+                    with _relay_cmd_lock:
+                        process_relay_commands(db)
                     quota.success("relay")
                     # Keep relay status sync lightweight; skip per-command status writes.
                 except Exception as e:
@@ -1248,28 +1484,49 @@ def main():
                     elif "Timeout" in str(e):
                         quota.fail("relay", e)  # timeout likely means 429-throttled
             
-            # === LOW PRIORITY: Override mode every ~120s ===
+            # === Settings docs: every due settings/* doc in one get_all RPC ===
+            settings_due = []
             if sync_count % OVERRIDE_CHECK_CYCLES == 0 and not quota.should_skip("override"):
+                settings_due.append("override")
+            if sync_count % TIMEMODE_CHECK_CYCLES == 0 and not quota.should_skip("timemode"):
+                settings_due.append("timemode")
+            if sync_count % CALMODE_CHECK_CYCLES == 0 and not quota.should_skip("calmode"):
+                settings_due.append("calmode")
+            if sync_count % CAL_UPDATE_CYCLES == 0 and not quota.should_skip("cal_update"):
+                settings_due.append("cal_update")
+            settings_docs = {}
+            if settings_due:
+                try:
+                    settings_docs = fetch_settings_docs(db, settings_due)
+                except Exception as e:
+                    print(f"  ⚠️ Settings fetch error: {e}")
+                    if _is_quota_error(e) or "Timeout" in str(e):
+                        for op in settings_due:
+                            quota.fail(op, e)
+                    settings_due = []
+
+            # === LOW PRIORITY: Override mode every ~5s ===
+            if "override" in settings_due:
                 try:
-                    last_override_state = check_override_mode(db, last_override_state)
+                    last_override_state = check_override_mode(db, last_override_state, settings_docs.get("override"))
                     quota.success("override")
                 except Exception as e:
                     if _is_quota_error(e) or "Timeout" in str(e):
                         quota.fail("override", e)
 
             # === LOW PRIORITY: Time mode every ~5s (demo control) ===
-            if sync_count % TIMEMODE_CHECK_CYCLES == 0 and not quota.should_skip("timemode"):
+            if "timemode" in settings_due:
                 try:
-                    last_time_mode = check_time_mode(db, last_time_mode)
+                    last_time_mode = check_time_mode(db, last_time_mode, settings_docs.get("timemode"))
                     quota.success("timemode")
                 except Exception as e:
                     if _is_quota_error(e) or "Timeout" in str(e):
                         quota.fail("timemode", e)
             
             # === LOW PRIORITY: Cal mode every ~5 min ===
-            if sync_count % CALMODE_CHECK_CYCLES == 0 and not quota.should_skip("calmode"):
+            if "calmode" in settings_due:
                 try:
-                    last_cal_mode_state = check_calibration_mode(db, last_cal_mode_state)
+                    last_cal_mode_state = check_calibration_mode(db, last_cal_mode_state, settings_docs.get("calmode"))
                     quota.success("calmode")
                 except Exception as e:
                     if _is_quota_error(e) or "Timeout" in str(e):
@@ -1296,9 +1553,9 @@ def main():
                         quota.fail("history", e)
             
             # === Calibration updates every ~10 min ===
-            if sync_count % CAL_UPDATE_CYCLES == 0 and not quota.should_skip("cal_update"):
+            if "cal_update" in settings_due:
                 try:
-                    last_cal_check = check_calibration_updates(db, last_cal_check)
+                    last_cal_check = check_calibration_updates(db, last_cal_check, settings_docs.get("cal_update"))
                     quota.success("cal_update")
                 except Exception as e:
                     if _is_quota_error(e) or "Timeout" in str(e):
@@ -13,9 +13,20 @@ import time
 import argparse
 import logging
 import os
+import sys
+import signal
+import queue
+import threading
 from datetime import datetime, timezone
 from sqlalchemy import text
-from db import get_session, SensorReading
+from db import engine, SensorReading
+
+# orjson parses bytes directly and is several times faster than stdlib json
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
 logger = logging.getLogger("ingest_serial")
@@ -37,69 +48,117 @@ try:
 except Exception as e:
     logger.warning(f"Firebase initialization failed: {e}")
 
-def ingest_json(session, json_data):
-    """Parse ESP32 JSON and save to database."""
+# Rows are buffered across messages and written in one executemany per batch
+BATCH_MAX_ROWS = 50       # flush once this many readings are pending
+BATCH_MAX_AGE_S = 5.0     # ...or when the oldest pending reading is this old
+WRITE_QUEUE_MAX = 256     # batches waiting for the DB writer (reader blocks when full)
+RECONNECT_DELAY_S = 2.0   # wait before reopening the port after a SerialException
+_SENSOR_INSERT = SensorReading.__table__.insert()
+
+
+class LineReader:
+    """Buffered line splitter over a pyserial port.
+
+    Pulls whatever the OS RX buffer holds in one read() and splits it on
+    newlines, instead of a readline() per line. Partial lines are carried
+    over to the next call.
+    """
+    MAX_PARTIAL = 4096  # drop a runaway line with no newline (line noise)
+
+    def __init__(self, ser):
+        self.ser = ser
+        self.buf = bytearray()
+
+    def read_lines(self) -> list:
+        """Return the complete lines received so far (blocks up to ser.timeout)."""
+        chunk = self.ser.read(self.ser.in_waiting or 1)
+        if not chunk:
+            return []
+        self.buf += chunk
+        if b"\n" not in chunk:
+            if len(self.buf) > self.MAX_PARTIAL:
+                self.buf.clear()
+            return []
+        *lines, rest = self.buf.split(b"\n")
+        self.buf = bytearray(rest)
+        return lines
+
+
+_ESP32_META = {"source": "esp32"}  # shared by rows without a voltage (never mutated)
+
+
+def readings_to_rows(json_data) -> list:
+    """Parse ESP32 JSON into sensor_readings row dicts (not yet inserted)."""
+    data = _json_loads(json_data)
+    readings = data.get("readings", {})
+    ts = datetime.now(timezone.utc)
+    rows = []
+
+    # Parse sensor readings
+    if "temp" in readings:
+        rows.append({
+            "timestamp": ts,
+            "sensor": "temperature_c",
+            "value": float(readings["temp"]),
+            "unit": "C",
+            "meta": _ESP32_META,
+        })
+
+    if "humidity" in readings:
+        rows.append({
+            "timestamp": ts,
+            "sensor": "humidity",
+            "value": float(readings["humidity"]),
+            "unit": "%",
+            "meta": _ESP32_META,
+        })
+
+    if "tds" in readings:
+        rows.append({
+            "timestamp": ts,
+            "sensor": "tds_ppm",
+            "value": float(readings["tds"]),
+            "unit": "ppm",
+            "meta": {"source": "esp32", "voltage": readings.get("tds_v")},
+        })
+
+    if "ph_v" in readings or "ph" in readings:
+        # Convert voltage to pH if available
+        ph_val = readings.get("ph", readings.get("ph_v"))
+        rows.append({
+            "timestamp": ts,
+            "sensor": "ph",
+            "value": float(ph_val),
+            "unit": "pH",
+            "meta": {"source": "esp32", "voltage": readings.get("ph_v")},
+        })
+
+    if "do_v" in readings or "do" in readings:
+        do_val = readings.get("do", readings.get("do_v"))
+        rows.append({
+            "timestamp": ts,
+            "sensor": "do_mg_per_l",
+            "value": float(do_val),
+            "unit": "mg/L",
+            "meta": {"source": "esp32", "voltage": readings.get("do_v")},
+        })
+
+    return rows
+
+
+def write_rows(rows):
+    """Insert a batch of row dicts with a single executemany in one transaction.
+
+    Uses a Core insert on the shared engine (no ORM session / identity map);
+    engine.begin() commits on success and rolls back on error.
+    """
+    if not rows:
+        return
     try:
-        data = json.loads(json_data)
-        readings = data.get("readings", {})
-        
-        # Parse sensor readings
-        if "temp" in readings:
-            r = SensorReading(
-                timestamp=datetime.now(timezone.utc),
-                sensor="temperature_c",
-                value=float(readings["temp"]),
-                unit="C",
-                meta={"source": "esp32"}
-            )
-            session.add(r)
-        
-        if "humidity" in readings:
-            r = SensorReading(
-                timestamp=datetime.now(timezone.utc),
-                sensor="humidity",
-                value=float(readings["humidity"]),
-                unit="%",
-                meta={"source": "esp32"}
-            )
-            session.add(r)
-        
-        if "tds" in readings:
-            r = SensorReading(
-                timestamp=datetime.now(timezone.utc),
-                sensor="tds_ppm",
-                value=float(readings["tds"]),
-                unit="ppm",
-                meta={"source": "esp32", "voltage": readings.get("tds_v")}
-            )
-            session.add(r)
-        
-        if "ph_v" in readings or "ph" in readings:
-            # Convert voltage to pH if available
-            ph_val = readings.get("ph", readings.get("ph_v"))
-            r = SensorReading(
-                timestamp=datetime.now(timezone.utc),
-                sensor="ph",
-                value=float(ph_val),
-                unit="pH",
-                meta={"source": "esp32", "voltage": readings.get("ph_v")}
-            )
-            session.add(r)
-        
-        if "do_v" in readings or "do" in readings:
-            do_val = readings.get("do", readings.get("do_v"))
-            r = SensorReading(
-                timestamp=datetime.now(timezone.utc),
-                sensor="do_mg_per_l",
-                value=float(do_val),
-                unit="mg/L",
-                meta={"source": "esp32", "voltage": readings.get("do_v")}
-            )
-            session.add(r)
-        
-        session.commit()
-        logger.info(f"Ingested readings from ESP32")
-        
+        with engine.begin() as conn:
+            conn.execute(_SENSOR_INSERT, rows)
+        logger.info(f"Ingested {len(rows)} readings from ESP32")
+
         # Sync to Firebase if available
         # DISABLED: firebase_sync.py now handles this more efficiently (every 30s)
         # Having two places sync to Firebase with every reading caused quota exhaustion
@@ -125,11 +184,21 @@ def ingest_json(session, json_data):
         #     except Exception as e:
         #         logger.warning(f"Firebase sync failed: {e}")
         
-    except json.JSONDecodeError as e:
-        logger.debug(f"Invalid JSON: {e}")
     except Exception as e:
-        logger.error(f"Error ingesting data: {e}")
-        session.rollback()
+        logger.error(f"Error writing {len(rows)} readings: {e}")
+
+def _db_writer(write_q: queue.Queue):
+    """Consumer thread: drain row batches from the queue into the database.
+
+    Runs DB commits off the serial-reader thread so a slow or locked SQLite
+    write never stalls serial reads. A ``None`` batch stops the thread.
+    """
+    while True:
+        rows = write_q.get()
+        if rows is None:
+            break
+        write_rows(rows)
+
 
 def main():
     parser = argparse.ArgumentParser()
@@ -137,31 +206,71 @@ def main():
     parser.add_argument("--baud", type=int, default=115200, help="Baud rate")
     args = parser.parse_args()
     
-    logger.info(f"Opening serial port {args.port} at {args.baud} baud")
+    write_q = queue.Queue(maxsize=WRITE_QUEUE_MAX)
+    writer = threading.Thread(target=_db_writer, args=(write_q,), daemon=True)
+    writer.start()
+    # Turn SIGTERM (systemd stop) into SystemExit so pending rows get flushed
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
     
+    # Supervised loop: the port is only closed/reopened on SerialException;
+    # bad lines are skipped individually without touching the connection.
+    ser = None
+    reader = None
+    pending = []
+    batch_started = time.monotonic()
     try:
-        ser = serial.Serial(args.port, args.baud, timeout=2)
-        session = get_session()
-        
-        logger.info("Listening for ESP32 data...")
-        
         while True:
+            if ser is None:
+                logger.info(f"Opening serial port {args.port} at {args.baud} baud")
+                try:
+                    ser = serial.Serial(args.port, args.baud, timeout=1)
+                except serial.SerialException as e:
+                    logger.error(f"Serial port error: {e}")
+                    time.sleep(RECONNECT_DELAY_S)
+                    continue
+                reader = LineReader(ser)
+                logger.info("Listening for ESP32 data...")
+            
             try:
-                if ser.in_waiting:
-                    line = ser.readline().decode('utf-8', errors='ignore').strip()
-                    if line and line.startswith('{'):
-                        logger.debug(f"Received: {line[:80]}")
-                        ingest_json(session, line)
-                time.sleep(0.01)
-            except Exception as e:
-                logger.error(f"Error reading serial: {e}")
-                time.sleep(1)
-    
-    except serial.SerialException as e:
-        logger.error(f"Serial port error: {e}")
+                lines = reader.read_lines()
+            except (serial.SerialException, OSError) as e:
+                # Unplugging the USB adapter surfaces as a bare OSError (EIO)
+                # from in_waiting, not a SerialException
+                logger.error(f"Serial port error: {e} — reopening")
+                ser.close()
+                ser = None
+                time.sleep(RECONNECT_DELAY_S)
+                continue
+            
+            for line in lines:
+                line = line.strip()
+                if not line or not line.startswith(b'{'):
+                    continue
+                logger.debug("Received: %r", line[:80])
+                try:
+                    rows = readings_to_rows(line)
+                except json.JSONDecodeError as e:
+                    logger.debug(f"Invalid JSON: {e}")
+                    continue
+                except Exception as e:
+                    logger.error(f"Error ingesting data: {e}")
+                    continue
+                if rows:
+                    if not pending:
+                        batch_started = time.monotonic()
+                    pending.extend(rows)
+            
+            if pending and (len(pending) >= BATCH_MAX_ROWS
+                            or time.monotonic() - batch_started >= BATCH_MAX_AGE_S):
+                write_q.put(pending)
+                pending = []
     finally:
-        ser.close()
-        session.close()
+        if pending:
+            write_q.put(pending)
+        write_q.put(None)
+        writer.join(timeout=10)
+        if ser is not None:
+            ser.close()
 
 if __name__ == "__main__":
     main()
@@ -41,6 +41,7 @@ class PlantGrowthPredictor:
         self.models = {"aeroponics": {}, "dwc": {}}
         self.model_types = {"aeroponics": {}, "dwc": {}}
         self.scalers = {"aeroponics": None, "dwc": None}
+        self.scale_params = {"aeroponics": None, "dwc": None}
         self.system_ready = {"aeroponics": False, "dwc": False}
 
         self._load_models()
@@ -61,6 +62,7 @@ class PlantGrowthPredictor:
                 scaler_path = os.path.join(self.models_dir, scaler_name)
                 if os.path.exists(scaler_path):
                     self.scalers[system] = joblib.load(scaler_path)
+                    self.scale_params[system] = self._standard_scale_params(self.scalers[system])
                     print(f"[ML] Loaded {system} scaler: {scaler_path}", flush=True)
                 else:
                     print(f"[ML] Missing {system} scaler: {scaler_path}", flush=True)
@@ -85,6 +87,20 @@ class PlantGrowthPredictor:
         except Exception as e:
             print(f"[ML] Error loading ML-MARCH24-FINAL models: {e}", flush=True)
 
+    @staticmethod
+    def _standard_scale_params(scaler):
+        """(mean, scale) arrays of a fitted StandardScaler, or None for other scalers.
+
+        Applying them directly skips transform()'s per-call input validation
+        (and its feature-name warning for plain arrays) on a 1-row input.
+        """
+        if not (hasattr(scaler, "mean_") and hasattr(scaler, "scale_")):
+            return None
+        mean = np.ascontiguousarray(scaler.mean_, dtype=float) if getattr(scaler, "with_mean", True) else 0.0
+        scale = scaler.scale_
+        scale = np.ascontiguousarray(scale, dtype=float) if scale is not None else 1.0
+        return mean, scale
+
     def _features_array(self, sensor_data):
         vals = [
             float(sensor_data.get("ave_ph", 6.5)),
@@ -117,7 +133,12 @@ class PlantGrowthPredictor:
                     scaler = self.scalers.get(system)
                     if scaler is None:
                         raise RuntimeError(f"Missing scaler for {system} SVR target {target}")
-                    x_in = scaler.transform(x_raw)
+                    params = self.scale_params.get(system)
+                    if params is not None:
+                        mean, scale = params
+                        x_in = (x_raw - mean) / scale
+                    else:
+                        x_in = scaler.transform(x_raw)
 
                 p = model.predict(x_in)[0]
                 preds[target] = float(max(0.0, p))
@@ -15,6 +15,9 @@ import sys
 import time
 import os
 import glob
+import json
+import urllib.request
+import urllib.error
 
 def _auto_detect_serial_port() -> str:
     preferred = ["/dev/ttyUSB1", "/dev/ttyUSB0", "/dev/ttyACM0", "/dev/ttyACM1"]
@@ -27,36 +30,83 @@ def _auto_detect_serial_port() -> str:
 
 SERIAL_PORT = os.getenv("SERIAL_PORT", _auto_detect_serial_port())
 BAUD_RATE = 115200
+# firebase_sync.py keeps the port open and serves this proxy; using it avoids
+# reopening (and resetting) the ESP32 for every command.
+SERIAL_PROXY_URL = os.getenv("SERIAL_PROXY_URL", "http://127.0.0.1:5001/serial/send")
+
+RESPONSE_TIMEOUT = 0.5  # max wait for the first response line
+RESPONSE_IDLE = 0.05    # stop once the ESP32 has been silent this long
 
 def send_command(ser, cmd):
-    """Send a command and print the response with minimal latency."""
+    """Send a command and print the response with minimal latency.
+
+    Waits in the driver (read_until) instead of polling in_waiting:
+    up to RESPONSE_TIMEOUT for the first line, then RESPONSE_IDLE between lines.
+    """
     ser.write((cmd + "\n").encode())
     ser.flush()  # Flush immediately to ensure transmission
-    time.sleep(0.01)  # Reduced from 0.1s to 0.01s
+
+    ser.timeout = RESPONSE_TIMEOUT
+    while True:
+        data = ser.read_until(b"\n", 4096)
+        if not data:
+            break
+        line = data.decode('utf-8', errors='ignore').strip()
+        if line:
+            print(line)
+        ser.timeout = RESPONSE_IDLE
+
+def send_via_proxy(cmd):
+    """Send a command through the firebase_sync serial proxy and print the response.
+    Returns False if the proxy is not running."""
+    req = urllib.request.Request(
+        SERIAL_PROXY_URL,
+        data=json.dumps({"command": cmd}).encode(),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    try:
+        with urllib.request.urlopen(req, timeout=5) as resp:
+            result = json.loads(resp.read()).get("result", "")
+    except urllib.error.URLError as e:
+        if isinstance(e.reason, ConnectionRefusedError):
+            return False  # proxy not running -> caller opens the port itself
+        print(f"Error: serial proxy: {e.reason}")
+        return True  # command may have been sent; don't resend it directly
+    except (OSError, ValueError) as e:
+        print(f"Error: serial proxy: {e}")
+        return True
+    if result:
+        print(result)
+    return True
+
+def open_serial():
+    """Open the serial port directly (only when the proxy is unavailable)."""
+    ser = serial.Serial(SERIAL_PORT, BAUD_RATE, timeout=1)
+    time.sleep(0.5)  # Wait for connection
     
-    # Read response with timeout
-    start = time.time()
-    while (time.time() - start) < 0.5:  # Total read timeout: 500ms
-        if ser.in_waiting:
-            line = ser.readline().decode('utf-8', errors='ignore').strip()
-            if line:
-                print(line)
-                start = time.time()  # Reset timeout on each successful read
-        else:
-            time.sleep(0.001)  # Small sleep to avoid busy-waiting
+    # Clear any pending data
+    ser.reset_input_buffer()
+    return ser
 
 def main():
+    ser = None
+    use_proxy = True
+    
+    def run(cmd):
+        nonlocal ser, use_proxy
+        if use_proxy and send_via_proxy(cmd):
+            return
+        use_proxy = False
+        if ser is None:
+            ser = open_serial()
+        send_command(ser, cmd)
+    
     try:
-        ser = serial.Serial(SERIAL_PORT, BAUD_RATE, timeout=1)
-        time.sleep(0.5)  # Wait for connection
-        
-        # Clear any pending data
-        ser.reset_input_buffer()
-        
         if len(sys.argv) > 1:
             # Command line mode: join all args as the command
             cmd = " ".join(sys.argv[1:])
-            send_command(ser, cmd)
+            run(cmd)
         else:
             # Interactive mode
             print("=" * 50)
@@ -78,12 +128,13 @@ def main():
                     if cmd.lower() in ('quit', 'exit', 'q'):
                         print("Goodbye!")
                         break
-                    send_command(ser, cmd)
+                    run(cmd)
                 except KeyboardInterrupt:
                     print("\nGoodbye!")
                     break
         
-        ser.close()
+        if ser is not None:
+            ser.close()
         
     except serial.SerialException as e:
         print(f"Error: {e}")
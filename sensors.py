@@ -21,6 +21,7 @@ try:
     # ADS1115 (ADC for pH/TDS/DO probes)
     try:
         ads = ADS.ADS1115(_i2c)
+        ads.data_rate = 860  # max SPS: ~1.2ms per single-shot conversion instead of ~8ms at 128
         chan_ph = AnalogIn(ads, ADS.P0)
         chan_tds = AnalogIn(ads, ADS.P1)
         chan_do = AnalogIn(ads, ADS.P2)
@@ -62,7 +63,7 @@ def read_bme():
 
     # Validate temperature
     if not (math.isnan(t) or math.isinf(t)) and _BME_TEMP_MIN <= t <= _BME_TEMP_MAX:
-        result["temperature_c"] = round(t, 3)
+        result["temperature_c"] = t
         _last_good_bme["temperature_c"] = result["temperature_c"]
     elif "temperature_c" in _last_good_bme:
         result["temperature_c"] = _last_good_bme["temperature_c"]
@@ -71,14 +72,14 @@ def read_bme():
 
     # Validate humidity
     if not (math.isnan(h) or math.isinf(h)) and _BME_HUM_MIN <= h <= _BME_HUM_MAX:
-        result["humidity"] = round(h, 3)
+        result["humidity"] = h
         _last_good_bme["humidity"] = result["humidity"]
     elif "humidity" in _last_good_bme:
         result["humidity"] = _last_good_bme["humidity"]
 
     # Validate pressure
     if not (math.isnan(p) or math.isinf(p)) and _BME_PRESS_MIN <= p <= _BME_PRESS_MAX:
-        result["pressure_hpa"] = round(p, 3)
+        result["pressure_hpa"] = p
         _last_good_bme["pressure_hpa"] = result["pressure_hpa"]
     elif "pressure_hpa" in _last_good_bme:
         result["pressure_hpa"] = _last_good_bme["pressure_hpa"]
@@ -92,18 +93,21 @@ def read_analog():
     if not ads:
         # No mock data - return empty dict when ADS1115 not available
         return {}
-    v_ph = chan_ph.voltage
-    v_tds = chan_tds.voltage
-    v_do = chan_do.voltage
+    # Burst the three raw conversions first, then scale them to volts with the
+    # library's own conversion (no extra I2C reads)
+    raw_ph, raw_tds, raw_do = chan_ph.value, chan_tds.value, chan_do.value
+    v_ph = chan_ph.convert_to_voltage(raw_ph)
+    v_tds = chan_tds.convert_to_voltage(raw_tds)
+    v_do = chan_do.convert_to_voltage(raw_do)
     return {
-        "ph_voltage": round(v_ph, 4),
+        "ph_voltage": v_ph,
         "ph": calibrate_ph(v_ph),
-        "tds_voltage": round(v_tds, 4),
+        "tds_voltage": v_tds,
         "tds_ppm": calibrate_tds(v_tds),
-        "do_voltage": round(v_do, 4),
+        "do_voltage": v_do,
         "do_mg_per_l": calibrate_do(v_do),
     }
 
 if __name__ == "__main__":
-    print("BME280:", read_bme())
-    print("Analog:", read_analog())
+    print("BME280:", {k: f"{v:.3f}" for k, v in read_bme().items()})
+    print("Analog:", {k: f"{v:.4f}" for k, v in read_analog().items()})